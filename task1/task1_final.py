@@ -1,12 +1,440 @@
+from qgis.PyQt.QtCore import QVariant, QDate, QTime, QDateTime, QByteArray
 from qgis.core import (QgsProcessing,
                        QgsProcessingAlgorithm,
                        QgsProcessingParameterVectorLayer,
                        QgsProcessingParameterField,
                        QgsProcessingParameterNumber,
                        QgsProcessingParameterFileDestination,
-                       QgsRasterLayer)
+                       QgsProcessingParameterString,
+                       QgsProcessingParameterBoolean,
+                       QgsProcessingParameterEnum,
+                       QgsProcessingException,
+                       QgsRasterLayer,
+                       QgsCoordinateTransform,
+                       QgsFeatureRequest,
+                       QgsProcessingUtils,
+                       QgsProviderRegistry,
+                       QgsRectangle,
+                       QgsPointXY,
+                       QgsWkbTypes,
+                       QgsMemoryProviderUtils,
+                       QgsFields,
+                       QgsFeature,
+                       QgsField,
+                       QgsGeometry)
+from osgeo import gdal, ogr, osr
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import math
+import os
 import processing
 
+DEM_PIXEL_SIZE = 5.0
+DEM_NODATA = -9999
+#запас данных вокруг тайла. триангуляция подмножества вершин у своего края отличается
+#от общей, запас уводит эту зону за границу тайла; на стыках возможны небольшие расхождения
+DEM_TILE_OVERLAP = 250.0
+#при редких изолиниях запас удваивается, пока в тайле остаются дыры (nodata), но не больше этого
+DEM_MAX_TILE_OVERLAP = 2000.0
+#предел огрубления dem при автоподборе
+DEM_MAX_PIXEL_SIZE = 40.0
+
+#модель затрат для предварительной оценки - та же схема, что в task2/task2.py (там описание)
+COST_DEM_CELL = 2e-6
+COST_TIN_VERTEX = 2e-5
+COST_SETZ_VERTEX = 5e-6
+COST_SA_BUILD_EDGE = 5e-6
+COST_SA_EDGE = 2e-5
+COST_BUFFER_VERTEX = 5e-5
+BYTES_DEM_CELL = 12
+BYTES_VERTEX = 100
+
+# типы полей QGIS -> OGR: (тип, подтип)
+OGR_FIELD_TYPES = {
+    QVariant.Int: (ogr.OFTInteger, ogr.OFSTNone),
+    QVariant.UInt: (ogr.OFTInteger64, ogr.OFSTNone),
+    QVariant.LongLong: (ogr.OFTInteger64, ogr.OFSTNone),
+    QVariant.ULongLong: (ogr.OFTInteger64, ogr.OFSTNone),
+    QVariant.Double: (ogr.OFTReal, ogr.OFSTNone),
+    QVariant.Bool: (ogr.OFTInteger, ogr.OFSTBoolean),
+    QVariant.Date: (ogr.OFTDate, ogr.OFSTNone),
+    QVariant.Time: (ogr.OFTTime, ogr.OFSTNone),
+    QVariant.DateTime: (ogr.OFTDateTime, ogr.OFSTNone),
+    QVariant.ByteArray: (ogr.OFTBinary, ogr.OFSTNone),
+    QVariant.StringList: (ogr.OFTString, ogr.OFSTJSON),
+    QVariant.List: (ogr.OFTString, ogr.OFSTJSON),
+    QVariant.Map: (ogr.OFTString, ogr.OFSTJSON),
+}
+
+
+# значение атрибута QGIS -> поле OGR-объекта
+def set_ogr_value(ogr_feat, i, value):
+    if value is None or (hasattr(value, 'isNull') and value.isNull()):
+        return
+    if isinstance(value, QDateTime):
+        d, t = value.date(), value.time()
+        ogr_feat.SetField(i, d.year(), d.month(), d.day(), t.hour(), t.minute(), t.second() + t.msec() / 1000.0, 0)
+    elif isinstance(value, QDate):
+        ogr_feat.SetField(i, value.year(), value.month(), value.day(), 0, 0, 0, 0)
+    elif isinstance(value, QTime):
+        ogr_feat.SetField(i, 0, 0, 0, value.hour(), value.minute(), value.second() + value.msec() / 1000.0, 0)
+    elif isinstance(value, QByteArray):
+        ogr_feat.SetFieldBinaryFromHexString(i, bytes(value.toHex()).decode('ascii'))
+    elif isinstance(value, bool):
+        ogr_feat.SetField(i, int(value))
+    elif isinstance(value, (list, dict)):
+        ogr_feat.SetField(i, json.dumps(value, ensure_ascii=False, default=str))
+    elif isinstance(value, (int, float, str)):
+        ogr_feat.SetField(i, value)
+    else:
+        ogr_feat.SetField(i, str(value))
+
+
+# слой QGIS -> новый слой в открытом OGR-источнике (без своей транзакции)
+def copy_layer_to_ogr(ds, layer_name, layer):
+    srs = None
+    if layer.crs().isValid():
+        srs = osr.SpatialReference()
+        srs.ImportFromWkt(layer.crs().toWkt())
+    wkb = layer.wkbType()
+    geom_type = int(QgsWkbTypes.flatType(wkb))
+    if QgsWkbTypes.hasZ(wkb):
+        geom_type = ogr.GT_SetZ(geom_type)
+    if QgsWkbTypes.hasM(wkb):
+        geom_type = ogr.GT_SetM(geom_type)
+    out = ds.CreateLayer(layer_name, srs, geom_type, ['FID=fid', 'GEOMETRY_NAME=geom'])
+    if out is None:
+        raise QgsProcessingException(f'не удалось создать слой {layer_name}')
+    # fid в GeoPackage - служебный столбец
+    attrs = [i for i, field in enumerate(layer.fields()) if field.name().lower() != 'fid']
+    for i in attrs:
+        field = layer.fields().at(i)
+        ftype, subtype = OGR_FIELD_TYPES.get(field.type(), (ogr.OFTString, ogr.OFSTNone))
+        defn = ogr.FieldDefn(field.name(), ftype)
+        defn.SetSubType(subtype)
+        if ftype == ogr.OFTString and subtype == ogr.OFSTNone and field.length() > 0:
+            defn.SetWidth(field.length())
+        if out.CreateField(defn) != 0:
+            raise QgsProcessingException(f'не удалось создать поле {field.name()} в слое {layer_name}')
+    out_defn = out.GetLayerDefn()
+    for feat in layer.getFeatures():
+        ogr_feat = ogr.Feature(out_defn)
+        for n, i in enumerate(attrs):
+            set_ogr_value(ogr_feat, n, feat.attribute(i))
+        if feat.hasGeometry():
+            ogr_feat.SetGeometry(ogr.CreateGeometryFromWkb(bytes(feat.geometry().asWkb())))
+        if out.CreateFeature(ogr_feat) != 0:
+            raise QgsProcessingException(f'не удалось записать объект {feat.id()} слоя {layer_name}')
+    return out.GetFeatureCount()
+
+
+# слои [(имя, QgsVectorLayer)] -> один GeoPackage, все слои в одной транзакции:
+# при ошибке файл не остается с частью слоев
+def write_gpkg_layers(path, layers, feedback):
+    driver = ogr.GetDriverByName('GPKG')
+    if os.path.exists(path):
+        driver.DeleteDataSource(path)
+    ds = driver.CreateDataSource(path)
+    if ds is None:
+        raise QgsProcessingException(f'не удалось создать {path}')
+    counts = []
+    ds.StartTransaction()
+    try:
+        for layer_name, layer in layers:
+            counts.append((layer_name, copy_layer_to_ogr(ds, layer_name, layer)))
+        if ds.CommitTransaction() != 0:
+            raise QgsProcessingException(f'не удалось завершить транзакцию в {path}')
+    except Exception:
+        ds.RollbackTransaction()
+        ds = None
+        driver.DeleteDataSource(path)
+        raise
+    ds = None
+    for layer_name, count in counts:
+        feedback.pushInfo(f'{path}: слой {layer_name} ({count} объектов)')
+
+
+# один тайл dem: триангуляция (linear) по вершинам изолиний через gdal_grid.
+# в отличие от qgis:tininterpolation изолинии - просто точки, а не ребра-ограничения триангуляции
+def grid_tile(src_path, src_layer, z_field, bounds, size, out_path, margin):
+    xmin, ymin, xmax, ymax = bounds
+    window = [xmin - margin, ymin - margin, xmax + margin, ymax + margin]
+    opts = gdal.GridOptions(
+        #spatFilter выбирает объекты целиком, -clipsrc режет их вершины по окну тайла
+        options=['-clipsrc'] + [str(v) for v in window],
+        format='GTiff',
+        outputType=gdal.GDT_Float32,
+        width=size[0],
+        height=size[1],
+        outputBounds=[xmin, ymax, xmax, ymin],
+        algorithm=f'linear:radius=-1:nodata={DEM_NODATA}',
+        zfield=z_field,
+        layers=[src_layer] if src_layer else None,
+        spatFilter=window,
+        creationOptions=['TILED=YES', 'COMPRESS=DEFLATE', 'PREDICTOR=3'])
+    ds = gdal.Grid(out_path, src_path, options=opts)
+    if ds is None:
+        raise QgsProcessingException(f'gdal_grid не смог построить тайл {bounds}')
+    holes = int((ds.GetRasterBand(1).ReadAsArray() == DEM_NODATA).sum())
+    ds = None
+    return holes
+
+
+#тайл вне оболочки вершин окна получает nodata: запас удваиваем, пока дыры уменьшаются.
+#дыры, которые не закрываются, лежат вне оболочки всех изолиний
+def grid_tile_filled(src_path, src_layer, z_field, bounds, size, out_path):
+    margin = DEM_TILE_OVERLAP
+    holes = grid_tile(src_path, src_layer, z_field, bounds, size, out_path, margin)
+    while holes and margin * 2 <= DEM_MAX_TILE_OVERLAP:
+        margin *= 2
+        retry = grid_tile(src_path, src_layer, z_field, bounds, size, out_path, margin)
+        if retry >= holes:
+            break
+        holes = retry
+    return out_path, margin
+
+
+#коридор: охват дорог с запасом, но не шире изолиний
+def dem_corridor(contours, roads, context):
+    to_contours = QgsCoordinateTransform(roads.crs(), contours.crs(), context.transformContext())
+    extent = to_contours.transformBoundingBox(roads.extent())
+    extent.grow(DEM_TILE_OVERLAP)
+    return extent.intersect(contours.extent())
+
+
+#память одного тайла: ячейки растра + вершины изолиний в окне с запасом
+def dem_tile_memory_mb(contours_prof, pixel_size, tile_size):
+    window = tile_size + 2 * DEM_TILE_OVERLAP
+    ext = contours_prof['extent']
+    density = contours_prof['vertices'] / max(ext.width() * ext.height(), 1.0)
+    return ((tile_size / pixel_size) ** 2 * BYTES_DEM_CELL + density * window ** 2 * BYTES_VERTEX) / 2 ** 20
+
+
+#число потоков dem: не больше ядер и столько, сколько тайлов влезает в предел памяти
+def dem_workers(tile_mb, max_mb):
+    workers = os.cpu_count() or 1
+    if max_mb > 0:
+        workers = max(1, min(workers, int(max_mb // max(tile_mb, 1e-6))))
+    return workers
+
+
+#dem по тайлам в пуле потоков (gdal отпускает gil), тайлы без дорог пропускаем
+def build_dem_tiled(contours, z_field, roads, pixel_size, tile_size, workers, context, feedback):
+    uri = QgsProviderRegistry.instance().decodeUri(contours.providerType(), contours.source())
+    if contours.providerType() == 'ogr' and uri.get('path'):
+        src_path, src_layer = uri['path'], uri.get('layerName')
+    else:
+        src_path = processing.run("native:savefeatures", {
+            'INPUT': contours,
+            'OUTPUT': QgsProcessingUtils.generateTempFilename('contours.gpkg')
+        }, context=context, feedback=feedback)['OUTPUT']
+        src_layer = None
+
+    extent = dem_corridor(contours, roads, context)
+    if extent.isEmpty():
+        raise QgsProcessingException('охват дорог не пересекается с изолиниями')
+
+    px = pixel_size
+    x0 = math.floor(extent.xMinimum() / px) * px
+    y0 = math.floor(extent.yMinimum() / px) * px
+    tile_px = max(1, int(tile_size / px))
+    cols_px = math.ceil((extent.xMaximum() - x0) / px)
+    rows_px = math.ceil((extent.yMaximum() - y0) / px)
+
+    tmp_dir = QgsProcessingUtils.tempFolder()
+    tasks = []
+    for i in range(0, cols_px, tile_px):
+        for j in range(0, rows_px, tile_px):
+            w = min(tile_px, cols_px - i)
+            h = min(tile_px, rows_px - j)
+            tile = QgsRectangle(x0 + i * px, y0 + j * px, x0 + (i + w) * px, y0 + (j + h) * px)
+            request = QgsFeatureRequest().setFilterRect(tile).setDestinationCrs(contours.crs(), context.transformContext()).setNoAttributes().setLimit(1)
+            if not any(True for _ in roads.getFeatures(request)):
+                continue
+            out_path = os.path.join(tmp_dir, f'dem_tile_{i}_{j}.tif')
+            tasks.append(((tile.xMinimum(), tile.yMinimum(), tile.xMaximum(), tile.yMaximum()), (w, h), out_path))
+
+    if not tasks:
+        raise QgsProcessingException('нет тайлов dem с дорогами')
+    feedback.pushInfo(f'dem: {len(tasks)} тайлов по {tile_px}x{tile_px} px, потоков: {workers}')
+
+    tile_paths = []
+    widened = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(grid_tile_filled, src_path, src_layer, z_field, bounds, size, out_path) for bounds, size, out_path in tasks]
+        for n, future in enumerate(as_completed(futures), start=1):
+            if feedback.isCanceled():
+                for f in futures:
+                    f.cancel()
+                return None
+            tile_path, margin = future.result()
+            tile_paths.append(tile_path)
+            widened += margin > DEM_TILE_OVERLAP
+            feedback.setProgress(int(100 * n / len(futures)))
+    if widened:
+        feedback.pushInfo(f'dem: у {widened} тайлов запас увеличен из-за редких изолиний')
+
+    #мозаика тайлов -> один тайловый сжатый tif
+    vrt_path = os.path.join(tmp_dir, 'dem_tiles.vrt')
+    vrt = gdal.BuildVRT(vrt_path, tile_paths, srcNodata=DEM_NODATA, VRTNodata=DEM_NODATA)
+    vrt = None
+    dem_path = QgsProcessingUtils.generateTempFilename('dem.tif')
+    dem = gdal.Translate(dem_path, vrt_path, format='GTiff', noData=DEM_NODATA,
+                         creationOptions=['TILED=YES', 'COMPRESS=DEFLATE', 'PREDICTOR=3', 'BIGTIFF=IF_SAFER'])
+    if dem is None:
+        raise QgsProcessingException('не удалось собрать мозаику dem')
+    dem = None
+    return dem_path
+
+
+#dem одной триангуляцией qgis:tininterpolation по всему охвату изолиний,
+#изолинии - структурные линии (ребра-ограничения tin), как в исходной версии скрипта
+def build_dem_tin(contours, pixel_size, context, feedback):
+    tin_data = f"{contours.source()}::~::0::~::2::~::1"
+    ext = contours.extent()
+    ext_str = f'{ext.xMinimum()},{ext.xMaximum()},{ext.yMinimum()},{ext.yMaximum()} [{contours.crs().authid()}]'
+    return processing.run("qgis:tininterpolation", {
+        'INTERPOLATION_DATA': tin_data,
+        'METHOD': 0,
+        'EXTENT': ext_str,
+        'PIXEL_SIZE': pixel_size,
+        'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
+    }, context=context, feedback=feedback)['OUTPUT']
+
+
+#объекты дорог, у которых хотя бы одна вершина попала на nodata dem:
+#setzfromraster даст им z=0 и ложный уклон
+def roads_on_nodata(roads, raster, context):
+    provider = raster.dataProvider()
+    to_raster = QgsCoordinateTransform(roads.crs(), raster.crs(), context.transformContext())
+    count = 0
+    for f in roads.getFeatures(QgsFeatureRequest().setNoAttributes()):
+        if not f.hasGeometry():
+            continue
+        for v in f.geometry().vertices():
+            value, ok = provider.sample(to_raster.transform(QgsPointXY(v.x(), v.y())), 1)
+            if not ok or math.isnan(value):
+                count += 1
+                break
+    return count
+
+
+# быстрый профиль слоя: число объектов - точно (проход без геометрии и атрибутов,
+# работает и когда featureCount() неизвестен), вершины - по равномерной выборке, охват
+def layer_profile(layer, sample=1000):
+    id_request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setNoAttributes()
+    fids = [f.id() for f in layer.getFeatures(id_request)]
+    n = len(fids)
+    step = max(1, n // sample)
+    seen = 0
+    verts = 0
+    for f in layer.getFeatures(QgsFeatureRequest().setFilterFids(fids[::step][:sample]).setNoAttributes()):
+        if not f.geometry().isNull():
+            verts += f.geometry().constGet().nCoordinates()
+        seen += 1
+    return {'features': n, 'vertices': int(verts * n / seen) if seen else 0, 'extent': layer.sourceExtent()}
+
+
+#прогноз времени (сек) по шагам и памяти (мб) для заданного шага dem; доля dem - отдельно.
+#service area и buffer считаем только для достижимой части сети: круги радиуса limit вокруг остановок
+#tiled=False - одна триангуляция по всему охвату изолиний в один поток, растр целиком в памяти
+def estimate_run(roads_prof, contours_prof, corridor, n_stops, limit_val, pixel_size, tile_size, max_mb, tiled):
+    if tiled:
+        tile_mb = dem_tile_memory_mb(contours_prof, pixel_size, tile_size)
+        workers = dem_workers(tile_mb, max_mb)
+        cells = corridor.width() * corridor.height() / pixel_size ** 2
+        #каждая вершина попадает в несколько окон из-за запаса
+        overlap_factor = ((tile_size + 2 * DEM_TILE_OVERLAP) / tile_size) ** 2
+        dem_mb = tile_mb * workers
+    else:
+        workers = 1
+        ext = contours_prof['extent']
+        cells = ext.width() * ext.height() / pixel_size ** 2
+        overlap_factor = 1.0
+        dem_mb = (cells * BYTES_DEM_CELL + contours_prof['vertices'] * BYTES_VERTEX) / 2 ** 20
+    ext = roads_prof['extent']
+    roads_area = max(ext.width() * ext.height(), 1.0)
+    reach = [min(1.0, n * math.pi * limit_val ** 2 / roads_area) for n in n_stops]
+    stages = {
+        'dem': (cells * COST_DEM_CELL + contours_prof['vertices'] * overlap_factor * COST_TIN_VERTEX) / workers,
+        'высота': roads_prof['vertices'] * COST_SETZ_VERTEX,
+        'service area': sum(roads_prof['features'] * (COST_SA_BUILD_EDGE + f * COST_SA_EDGE) for f in reach),
+        'buffer': sum(roads_prof['vertices'] * f * COST_BUFFER_VERTEX for f in reach),
+    }
+    return {
+        'cells': cells,
+        'stages': stages,
+        'workers': workers,
+        'total_min': sum(stages.values()) / 60,
+        'memory_mb': dem_mb + roads_prof['vertices'] * 3 * BYTES_VERTEX / 2 ** 20,
+        'dem_min': stages['dem'] / 60,
+        'dem_mb': dem_mb,
+    }
+
+
+# относительное превышение пределов (0 - в пределах), предел 0 не проверяется
+def over_limits(total_min, memory_mb, max_min, max_mb):
+    over = 0.0
+    if max_min > 0:
+        over += max(0.0, total_min - max_min) / max_min
+    if max_mb > 0:
+        over += max(0.0, memory_mb - max_mb) / max_mb
+    return over
+
+
+# только полигональные части геометрии (multipolygon) или None, если их нет
+def polygon_parts(geom):
+    if geom is None or geom.isNull() or geom.isEmpty():
+        return None
+    if QgsWkbTypes.flatType(geom.wkbType()) == QgsWkbTypes.GeometryCollection:
+        geom.convertGeometryCollectionToSubclass(QgsWkbTypes.PolygonGeometry)
+    if geom.isEmpty() or geom.type() != QgsWkbTypes.PolygonGeometry:
+        return None
+    geom.convertToMultiType()
+    return geom
+
+
+#упрощенные копии полигонов (lod) с отчетом по вершинам и площади
+def build_lod_layer(poly_a, poly_b, poly_inter, tolerances):
+    def merged(layer):
+        return polygon_parts(QgsGeometry.unaryUnion([f.geometry() for f in layer.getFeatures()]))
+
+    #пустое пересечение (А и Б не встречаются) в lod не попадает
+    exact = {'poly_a': merged(poly_a), 'poly_b': merged(poly_b), 'intersection': merged(poly_inter)}
+    exact = {name: g for name, g in exact.items() if g is not None}
+
+    fields = QgsFields()
+    fields.append(QgsField('src', QVariant.String, 'string', 16))
+    fields.append(QgsField('tol_m', QVariant.Double, 'double', 10, 2))
+    fields.append(QgsField('n_vert', QVariant.Int))
+    fields.append(QgsField('n_vert_src', QVariant.Int))
+    fields.append(QgsField('area_dpct', QVariant.Double, 'double', 10, 3))
+    lod = QgsMemoryProviderUtils.createMemoryLayer('lod', fields, QgsWkbTypes.MultiPolygon, poly_a.crs())
+
+    feats = []
+    for tol in tolerances:
+        #simplify в geos сохраняет топологию; пересечение обрезаем по упрощенным А и Б, чтобы оставалось внутри.
+        #после обрезки могут остаться линии/точки касания или пустота - берем только полигоны
+        simple = {name: polygon_parts(g.simplify(tol)) for name, g in exact.items()}
+        for name in ('poly_a', 'poly_b'):
+            if simple.get('intersection') is not None and simple.get(name) is not None:
+                simple['intersection'] = polygon_parts(simple['intersection'].intersection(simple[name]))
+        for name, geom in simple.items():
+            if geom is None:
+                continue
+            exact_area = exact[name].area()
+            feat = QgsFeature(lod.fields())
+            feat.setGeometry(geom)
+            feat['src'] = name
+            feat['tol_m'] = tol
+            feat['n_vert'] = geom.constGet().nCoordinates()
+            feat['n_vert_src'] = exact[name].constGet().nCoordinates()
+            feat['area_dpct'] = 100 * (geom.area() - exact_area) / exact_area if exact_area else 0.0
+            feats.append(feat)
+    lod.dataProvider().addFeatures(feats)
+    return lod
+
+
 class AccessibilityIsochronesZ(QgsProcessingAlgorithm):
     INPUT_ROADS = 'INPUT_ROADS'
     MANUAL_H_FIELD = 'MANUAL_H_FIELD'
@@ -14,9 +442,17 @@ class AccessibilityIsochronesZ(QgsProcessingAlgorithm):
     STOPS_A = 'STOPS_A'
     STOPS_B = 'STOPS_B'
     TRAVEL_COST = 'TRAVEL_COST'
+    DEM_METHOD = 'DEM_METHOD'
+    DEM_TILE_SIZE = 'DEM_TILE_SIZE'
+    MAX_RUNTIME_MIN = 'MAX_RUNTIME_MIN'
+    MAX_MEMORY_MB = 'MAX_MEMORY_MB'
+    AUTO_COARSEN = 'AUTO_COARSEN'
     OUTPUT_A = 'OUTPUT_A'
     OUTPUT_B = 'OUTPUT_B'
     OUTPUT_INTERSECTION = 'OUTPUT_INTERSECTION'
+    OUTPUT_GPKG = 'OUTPUT_GPKG'
+    LOD_TOLERANCES = 'LOD_TOLERANCES'
+    OUTPUT_LOD = 'OUTPUT_LOD'
 
     def createInstance(self):
         return AccessibilityIsochronesZ()
@@ -74,36 +510,140 @@ class AccessibilityIsochronesZ(QgsProcessingAlgorithm):
             defaultValue=500)
         )
         
-        self.addParameter(QgsProcessingParameterFileDestination(self.OUTPUT_A, 'Полигон А', fileFilter='GeoPackage (*.gpkg)'))
-        self.addParameter(QgsProcessingParameterFileDestination(self.OUTPUT_B, 'Полигон Б', fileFilter='GeoPackage (*.gpkg)'))
-        self.addParameter(QgsProcessingParameterFileDestination(self.OUTPUT_INTERSECTION, 'Пересечение', fileFilter='GeoPackage (*.gpkg)'))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.DEM_METHOD, 
+            'Построение DEM', 
+            options=['TIN по изолиниям (структурные линии, как раньше)', 'По тайлам в коридоре УДС (gdal_grid linear, быстрее)'], 
+            defaultValue=0)
+        )
+        
+        self.addParameter(QgsProcessingParameterNumber(
+            self.DEM_TILE_SIZE, 
+            'Размер тайла DEM (м, для построения по тайлам)', 
+            type=QgsProcessingParameterNumber.Double, 
+            defaultValue=2000,
+            minValue=100)
+        )
+        
+        self.addParameter(QgsProcessingParameterNumber(
+            self.MAX_RUNTIME_MIN, 
+            'Предел времени расчета (мин)', 
+            type=QgsProcessingParameterNumber.Double, 
+            defaultValue=30,
+            minValue=0)
+        )
+        
+        self.addParameter(QgsProcessingParameterNumber(
+            self.MAX_MEMORY_MB, 
+            'Предел памяти (МБ)', 
+            type=QgsProcessingParameterNumber.Double, 
+            defaultValue=4096,
+            minValue=0)
+        )
+        
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.AUTO_COARSEN, 
+            'Огрублять DEM при превышении пределов', 
+            defaultValue=False)
+        )
+        
+        self.addParameter(QgsProcessingParameterFileDestination(self.OUTPUT_A, 'Полигон А', fileFilter='GeoPackage (*.gpkg)', optional=True))
+        self.addParameter(QgsProcessingParameterFileDestination(self.OUTPUT_B, 'Полигон Б', fileFilter='GeoPackage (*.gpkg)', optional=True))
+        self.addParameter(QgsProcessingParameterFileDestination(self.OUTPUT_INTERSECTION, 'Пересечение', fileFilter='GeoPackage (*.gpkg)', optional=True))
+        self.addParameter(QgsProcessingParameterFileDestination(self.OUTPUT_GPKG, 'Общий GeoPackage (все слои в одном файле)', fileFilter='GeoPackage (*.gpkg)', optional=True))
+        
+        self.addParameter(QgsProcessingParameterString(
+            self.LOD_TOLERANCES, 
+            'Допуски упрощения LOD (м, через запятую)', 
+            defaultValue='5,20,50', 
+            optional=True)
+        )
+        self.addParameter(QgsProcessingParameterFileDestination(self.OUTPUT_LOD, 'Упрощенные полигоны (LOD)', fileFilter='GeoPackage (*.gpkg)', optional=True, createByDefault=False))
 
     def processAlgorithm(self, parameters, context, feedback):
         source_roads = self.parameterAsVectorLayer(parameters, self.INPUT_ROADS, context)
         source_contours = self.parameterAsVectorLayer(parameters, self.INPUT_CONTOURS, context)
         limit_val = self.parameterAsDouble(parameters, self.TRAVEL_COST, context)
         manual_h_field = self.parameterAsString(parameters, self.MANUAL_H_FIELD, context)
+        tiled = self.parameterAsEnum(parameters, self.DEM_METHOD, context) == 1
+        tile_size = self.parameterAsDouble(parameters, self.DEM_TILE_SIZE, context)
+        max_min = self.parameterAsDouble(parameters, self.MAX_RUNTIME_MIN, context)
+        max_mb = self.parameterAsDouble(parameters, self.MAX_MEMORY_MB, context)
+        auto_coarsen = self.parameterAsBoolean(parameters, self.AUTO_COARSEN, context)
         
         path_a = self.parameterAsFileOutput(parameters, self.OUTPUT_A, context)
         path_b = self.parameterAsFileOutput(parameters, self.OUTPUT_B, context)
         path_inter = self.parameterAsFileOutput(parameters, self.OUTPUT_INTERSECTION, context)
+        path_gpkg = self.parameterAsFileOutput(parameters, self.OUTPUT_GPKG, context)
+        if not (path_a or path_b or path_inter or path_gpkg):
+            raise QgsProcessingException('укажите хотя бы один выход: полигоны или общий GeoPackage')
+        path_lod = self.parameterAsFileOutput(parameters, self.OUTPUT_LOD, context)
+        lod_str = self.parameterAsString(parameters, self.LOD_TOLERANCES, context) or ''
+        try:
+            lod_tolerances = sorted(float(v) for v in lod_str.replace(';', ',').split(',') if v.strip())
+        except ValueError:
+            raise QgsProcessingException('не удалось разобрать допуски LOD, пример: 5,20,50')
+        if any(tol <= 0 for tol in lod_tolerances):
+            raise QgsProcessingException('допуски LOD должны быть больше 0')
+
+        # шаг -1. предварительная оценка объема
+        feedback.pushInfo('шаг -1: оценка входных данных...')
+        roads_prof = layer_profile(source_roads)
+        contours_prof = layer_profile(source_contours)
+        corridor = dem_corridor(source_contours, source_roads, context)
+        feedback.pushInfo(f"УДС: {roads_prof['features']} объектов, ~{roads_prof['vertices']} вершин")
+        feedback.pushInfo(f"изолинии: {contours_prof['features']} объектов, ~{contours_prof['vertices']} вершин")
+        dem_ext = corridor if tiled else contours_prof['extent']
+        feedback.pushInfo(f'охват dem: {dem_ext.width():.0f} x {dem_ext.height():.0f} м')
+
+        n_stops = [max(0, self.parameterAsVectorLayer(parameters, key, context).featureCount()) for key in (self.STOPS_A, self.STOPS_B)]
+
+        def estimate(px):
+            return estimate_run(roads_prof, contours_prof, corridor, n_stops, limit_val, px, tile_size, max_mb, tiled)
+
+        pixel_size = DEM_PIXEL_SIZE
+        est = estimate(pixel_size)
+        over = over_limits(est['total_min'], est['memory_mb'], max_min, max_mb)
+        if over > 0 and auto_coarsen:
+            #огрубление поможет, только если без dem прогноз укладывается в пределы
+            base_over = over_limits(est['total_min'] - est['dem_min'], est['memory_mb'] - est['dem_mb'], max_min, max_mb)
+            if base_over > 0:
+                feedback.pushWarning('пределы превышены не из-за dem, шаг dem не меняем')
+            while over > 0 and base_over == 0 and pixel_size * 2 <= DEM_MAX_PIXEL_SIZE:
+                candidate = estimate(pixel_size * 2)
+                candidate_over = over_limits(candidate['total_min'], candidate['memory_mb'], max_min, max_mb)
+                if candidate_over >= over:
+                    break
+                pixel_size *= 2
+                est, over = candidate, candidate_over
+                feedback.pushWarning(f'прогноз выше пределов, шаг dem огрублен до {pixel_size} м')
 
-        # шаг 0. строим tin
+        feedback.pushInfo(f"dem {pixel_size} м: ~{est['cells']:.0f} ячеек, потоков: {est['workers']}")
+        for stage, sec in est['stages'].items():
+            feedback.pushInfo(f'  {stage}: ~{sec / 60:.1f} мин')
+        feedback.pushInfo(f"итого ~{est['total_min']:.1f} мин, пик памяти ~{est['memory_mb']:.0f} МБ")
+        if max_min > 0 and est['total_min'] > max_min:
+            feedback.pushWarning(f'прогноз времени выше предела ({max_min:.0f} мин): '
+                                 'включите огрубление DEM или уменьшите лимит (cost) / охват УДС')
+        if max_mb > 0 and est['memory_mb'] > max_mb:
+            if tiled:
+                feedback.pushWarning(f'прогноз памяти выше предела ({max_mb:.0f} МБ): '
+                                     'уменьшите размер тайла DEM или охват УДС')
+            else:
+                feedback.pushWarning(f'прогноз памяти выше предела ({max_mb:.0f} МБ): '
+                                     'включите огрубление DEM или построение DEM по тайлам')
+
+        # шаг 0. строим tin (целиком или по тайлам в коридоре дорог)
         feedback.pushInfo('шаг 0: строим tin из геометрии...')
 
-        tin_data = f"{source_contours.source()}::~::0::~::2::~::1"
-        
-        ext_str = f'{source_contours.extent().xMinimum()},{source_contours.extent().xMaximum()},{source_contours.extent().yMinimum()},{source_contours.extent().yMaximum()} [{source_contours.crs().authid()}]'
-        
-        tin_result = processing.run("qgis:tininterpolation", {
-            'INTERPOLATION_DATA': tin_data,
-            'METHOD': 0,
-            'EXTENT': ext_str,
-            'PIXEL_SIZE': 5.0,
-            'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-        }, context=context, feedback=feedback)
-        
-        tin_path = tin_result['OUTPUT']
+        if tiled:
+            #высота - третье поле слоя изолиний
+            z_field = source_contours.fields().at(2).name()
+            tin_path = build_dem_tiled(source_contours, z_field, source_roads, pixel_size, tile_size, est['workers'], context, feedback)
+            if tin_path is None:
+                return {}
+        else:
+            tin_path = build_dem_tin(source_contours, pixel_size, context, feedback)
 
         # прогрев растра
         temp_raster = QgsRasterLayer(tin_path, "temp_check", "gdal")
@@ -113,6 +653,12 @@ class AccessibilityIsochronesZ(QgsProcessingAlgorithm):
             feedback.reportError('ошибка: tin не создан!')
             return {}
 
+        #дороги над дырами dem получат z=0 и ложный уклон
+        on_nodata = roads_on_nodata(source_roads, temp_raster, context)
+        if on_nodata:
+            feedback.pushWarning(f'{on_nodata} объектов УДС проходят по ячейкам dem без данных (вне изолиний): '
+                                 'их высота будет 0, а штраф за уклон - ложным')
+
         # шаг 1. натягиваем высоту
         feedback.pushInfo('шаг 1: натягиваем высоту...')
         draped = processing.run("native:setzfromraster", {
@@ -168,7 +714,7 @@ class AccessibilityIsochronesZ(QgsProcessingAlgorithm):
             'OUTPUT': 'memory:poly_a_raw'
         }, context=context, feedback=feedback)['OUTPUT']
         
-        processing.run("native:fixgeometries", {'INPUT': poly_a_raw, 'OUTPUT': path_a}, context=context, feedback=feedback)
+        poly_a = processing.run("native:fixgeometries", {'INPUT': poly_a_raw, 'OUTPUT': 'memory:poly_a'}, context=context, feedback=feedback)['OUTPUT']
 
         # шаг 4. полигон Б
         feedback.pushInfo('шаг 4: полигон Б...')
@@ -189,10 +735,32 @@ class AccessibilityIsochronesZ(QgsProcessingAlgorithm):
             'OUTPUT': 'memory:poly_b_raw'
         }, context=context, feedback=feedback)['OUTPUT']
         
-        processing.run("native:fixgeometries", {'INPUT': poly_b_raw, 'OUTPUT': path_b}, context=context, feedback=feedback)
+        poly_b = processing.run("native:fixgeometries", {'INPUT': poly_b_raw, 'OUTPUT': 'memory:poly_b'}, context=context, feedback=feedback)['OUTPUT']
 
         # шаг 5. пересечение
         feedback.pushInfo('шаг 5: пересечение...')
-        processing.run("native:intersection", {'INPUT': path_a, 'OVERLAY': path_b, 'OUTPUT': path_inter}, context=context, feedback=feedback)
+        poly_inter = processing.run("native:intersection", {'INPUT': poly_a, 'OVERLAY': poly_b, 'OUTPUT': 'memory:intersection'}, context=context, feedback=feedback)['OUTPUT']
+
+        # шаг 6. запись результатов
+        feedback.pushInfo('шаг 6: запись результатов...')
+        results = {self.OUTPUT_A: poly_a, self.OUTPUT_B: poly_b, self.OUTPUT_INTERSECTION: poly_inter}
+        layer_names = {self.OUTPUT_A: 'poly_a', self.OUTPUT_B: 'poly_b', self.OUTPUT_INTERSECTION: 'intersection'}
+        paths = {self.OUTPUT_A: path_a, self.OUTPUT_B: path_b, self.OUTPUT_INTERSECTION: path_inter}
+
+        # упрощенные версии для отрисовки, точные остаются для площадей
+        if path_lod and lod_tolerances:
+            results[self.OUTPUT_LOD] = build_lod_layer(poly_a, poly_b, poly_inter, lod_tolerances)
+            layer_names[self.OUTPUT_LOD] = 'lod'
+            paths[self.OUTPUT_LOD] = path_lod
+
+        outputs = {}
+        for key, layer in results.items():
+            if paths[key]:
+                layer_name = os.path.splitext(os.path.basename(paths[key]))[0]
+                write_gpkg_layers(paths[key], [(layer_name, layer)], feedback)
+                outputs[key] = paths[key]
+        if path_gpkg:
+            write_gpkg_layers(path_gpkg, [(layer_names[key], layer) for key, layer in results.items()], feedback)
+            outputs[self.OUTPUT_GPKG] = path_gpkg
 
-        return {self.OUTPUT_A: path_a, self.OUTPUT_B: path_b, self.OUTPUT_INTERSECTION: path_inter}
\ No newline at end of file
+        return outputs
\ No newline at end of file
@@ -1,4 +1,4 @@
-from qgis.PyQt.QtCore import QCoreApplication, QVariant
+from qgis.PyQt.QtCore import QCoreApplication, QVariant, QDate, QTime, QDateTime, QByteArray
 from qgis.core import (
     QgsProcessing,
     QgsProcessingAlgorithm,
@@ -9,17 +9,253 @@ from qgis.core import (
     QgsProcessingParameterField,
     QgsProcessingParameterFeatureSink,
     QgsProcessingParameterNumber,
+    QgsProcessingParameterFileDestination,
+    QgsProcessingParameterBoolean,
     QgsProcessingException,
     QgsFeature,
     QgsFields,
     QgsField,
     QgsWkbTypes,
     QgsFeatureSink,
-    QgsGeometry
+    QgsGeometry,
+    QgsFeatureRequest,
+    QgsMemoryProviderUtils,
+    QgsProcessingContext,
+    QgsProcessingOutputLayerDefinition
 )
+from osgeo import ogr, osr
+import json
+import math
+import os
 import processing
 
 
+# Модель затрат для предварительной оценки (layer_profile / estimate_run).
+# COST_* - секунды на единицу данных (вершину, ребро, ячейку DEM), BYTES_* - байты
+# на единицу в памяти. Значения ориентировочные, а не результат замеров: их стоит
+# уточнять по логам прогонов (время шагов в журнале Processing) на своих данных.
+# task1 и task3 используют ту же схему и те же имена.
+COST_FIX_VERTEX = 2e-6
+COST_DEM_CELL = 2e-6
+COST_TIN_VERTEX = 2e-5
+COST_SETZ_VERTEX = 5e-6
+COST_SA_BUILD_EDGE = 5e-6
+COST_SA_EDGE = 2e-5
+COST_BUFFER_VERTEX = 5e-5
+COST_POP_TEST = 2e-5
+# ширина буфера, для которой откалиброван COST_BUFFER_VERTEX (значение по умолчанию)
+BUFFER_REF_DIST = 50.0
+BYTES_DEM_CELL = 12
+BYTES_VERTEX = 100
+DEM_PIXEL_SIZE = 30.0
+DEM_MAX_PIXEL_SIZE = 120.0
+
+
+# типы полей QGIS -> OGR: (тип, подтип)
+OGR_FIELD_TYPES = {
+    QVariant.Int: (ogr.OFTInteger, ogr.OFSTNone),
+    QVariant.UInt: (ogr.OFTInteger64, ogr.OFSTNone),
+    QVariant.LongLong: (ogr.OFTInteger64, ogr.OFSTNone),
+    QVariant.ULongLong: (ogr.OFTInteger64, ogr.OFSTNone),
+    QVariant.Double: (ogr.OFTReal, ogr.OFSTNone),
+    QVariant.Bool: (ogr.OFTInteger, ogr.OFSTBoolean),
+    QVariant.Date: (ogr.OFTDate, ogr.OFSTNone),
+    QVariant.Time: (ogr.OFTTime, ogr.OFSTNone),
+    QVariant.DateTime: (ogr.OFTDateTime, ogr.OFSTNone),
+    QVariant.ByteArray: (ogr.OFTBinary, ogr.OFSTNone),
+    QVariant.StringList: (ogr.OFTString, ogr.OFSTJSON),
+    QVariant.List: (ogr.OFTString, ogr.OFSTJSON),
+    QVariant.Map: (ogr.OFTString, ogr.OFSTJSON),
+}
+
+
+# значение атрибута QGIS -> поле OGR-объекта
+def set_ogr_value(ogr_feat, i, value):
+    if value is None or (hasattr(value, 'isNull') and value.isNull()):
+        return
+    if isinstance(value, QDateTime):
+        d, t = value.date(), value.time()
+        ogr_feat.SetField(i, d.year(), d.month(), d.day(), t.hour(), t.minute(), t.second() + t.msec() / 1000.0, 0)
+    elif isinstance(value, QDate):
+        ogr_feat.SetField(i, value.year(), value.month(), value.day(), 0, 0, 0, 0)
+    elif isinstance(value, QTime):
+        ogr_feat.SetField(i, 0, 0, 0, value.hour(), value.minute(), value.second() + value.msec() / 1000.0, 0)
+    elif isinstance(value, QByteArray):
+        ogr_feat.SetFieldBinaryFromHexString(i, bytes(value.toHex()).decode('ascii'))
+    elif isinstance(value, bool):
+        ogr_feat.SetField(i, int(value))
+    elif isinstance(value, (list, dict)):
+        ogr_feat.SetField(i, json.dumps(value, ensure_ascii=False, default=str))
+    elif isinstance(value, (int, float, str)):
+        ogr_feat.SetField(i, value)
+    else:
+        ogr_feat.SetField(i, str(value))
+
+
+# слой QGIS -> новый слой в открытом OGR-источнике (без своей транзакции)
+def copy_layer_to_ogr(ds, layer_name, layer):
+    srs = None
+    if layer.crs().isValid():
+        srs = osr.SpatialReference()
+        srs.ImportFromWkt(layer.crs().toWkt())
+    wkb = layer.wkbType()
+    geom_type = int(QgsWkbTypes.flatType(wkb))
+    if QgsWkbTypes.hasZ(wkb):
+        geom_type = ogr.GT_SetZ(geom_type)
+    if QgsWkbTypes.hasM(wkb):
+        geom_type = ogr.GT_SetM(geom_type)
+    out = ds.CreateLayer(layer_name, srs, geom_type, ['FID=fid', 'GEOMETRY_NAME=geom'])
+    if out is None:
+        raise QgsProcessingException(f'не удалось создать слой {layer_name}')
+    # fid в GeoPackage - служебный столбец
+    attrs = [i for i, field in enumerate(layer.fields()) if field.name().lower() != 'fid']
+    for i in attrs:
+        field = layer.fields().at(i)
+        ftype, subtype = OGR_FIELD_TYPES.get(field.type(), (ogr.OFTString, ogr.OFSTNone))
+        defn = ogr.FieldDefn(field.name(), ftype)
+        defn.SetSubType(subtype)
+        if ftype == ogr.OFTString and subtype == ogr.OFSTNone and field.length() > 0:
+            defn.SetWidth(field.length())
+        if out.CreateField(defn) != 0:
+            raise QgsProcessingException(f'не удалось создать поле {field.name()} в слое {layer_name}')
+    out_defn = out.GetLayerDefn()
+    for feat in layer.getFeatures():
+        ogr_feat = ogr.Feature(out_defn)
+        for n, i in enumerate(attrs):
+            set_ogr_value(ogr_feat, n, feat.attribute(i))
+        if feat.hasGeometry():
+            ogr_feat.SetGeometry(ogr.CreateGeometryFromWkb(bytes(feat.geometry().asWkb())))
+        if out.CreateFeature(ogr_feat) != 0:
+            raise QgsProcessingException(f'не удалось записать объект {feat.id()} слоя {layer_name}')
+    return out.GetFeatureCount()
+
+
+# слои [(имя, QgsVectorLayer)] -> один GeoPackage, все слои в одной транзакции:
+# при ошибке файл не остается с частью слоев
+def write_gpkg_layers(path, layers, feedback):
+    driver = ogr.GetDriverByName('GPKG')
+    if os.path.exists(path):
+        driver.DeleteDataSource(path)
+    ds = driver.CreateDataSource(path)
+    if ds is None:
+        raise QgsProcessingException(f'не удалось создать {path}')
+    counts = []
+    ds.StartTransaction()
+    try:
+        for layer_name, layer in layers:
+            counts.append((layer_name, copy_layer_to_ogr(ds, layer_name, layer)))
+        if ds.CommitTransaction() != 0:
+            raise QgsProcessingException(f'не удалось завершить транзакцию в {path}')
+    except Exception:
+        ds.RollbackTransaction()
+        ds = None
+        driver.DeleteDataSource(path)
+        raise
+    ds = None
+    for layer_name, count in counts:
+        feedback.pushInfo(f'{path}: слой {layer_name} ({count} объектов)')
+
+
+# временный слой в памяти из готового списка объектов.
+def memory_layer(name, fields, wkb_type, crs, features):
+    layer = QgsMemoryProviderUtils.createMemoryLayer(name, fields, wkb_type, crs)
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+# только полигональные части геометрии (multipolygon) или None, если их нет
+def polygon_parts(geom):
+    if geom is None or geom.isNull() or geom.isEmpty():
+        return None
+    if QgsWkbTypes.flatType(geom.wkbType()) == QgsWkbTypes.GeometryCollection:
+        geom.convertGeometryCollectionToSubclass(QgsWkbTypes.PolygonGeometry)
+    if geom.isEmpty() or geom.type() != QgsWkbTypes.PolygonGeometry:
+        return None
+    geom.convertToMultiType()
+    return geom
+
+
+# упрощает изохроны (от меньшего интервала к большему) с сохранением топологии.
+# меньшая изохрона обрезается по упрощённой большей, чтобы вложенность не нарушалась.
+# если от изохроны не осталось полигона, на её месте None.
+def simplify_nested(geoms, tolerance):
+    simplified = [polygon_parts(g.simplify(tolerance)) for g in geoms]
+    for k in range(len(simplified) - 2, -1, -1):
+        if simplified[k] is not None and simplified[k + 1] is not None:
+            simplified[k] = polygon_parts(simplified[k].intersection(simplified[k + 1]))
+    return simplified
+
+
+# быстрый профиль слоя: число объектов - точно (проход без геометрии и атрибутов,
+# работает и когда featureCount() неизвестен), вершины - по равномерной выборке, охват
+def layer_profile(layer, sample=1000):
+    id_request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setNoAttributes()
+    fids = [f.id() for f in layer.getFeatures(id_request)]
+    n = len(fids)
+    step = max(1, n // sample)
+    seen = 0
+    verts = 0
+    for f in layer.getFeatures(QgsFeatureRequest().setFilterFids(fids[::step][:sample]).setNoAttributes()):
+        if not f.geometry().isNull():
+            verts += f.geometry().constGet().nCoordinates()
+        seen += 1
+    return {'features': n, 'vertices': int(verts * n / seen) if seen else 0, 'extent': layer.sourceExtent()}
+
+
+# прогноз времени по шагам (сек) и памяти (МБ); отдельно - доля DEM.
+# contours_prof = None, если DEM не строится.
+# поиск по графу и буфер считаются только для достижимой части сети:
+# круг радиуса speed * t против охвата сети.
+def estimate_run(net_prof, contours_prof, pop_count, intervals, speed_kmh, buffer_dist, pixel_size):
+    extent = net_prof['extent']
+    net_area = max(extent.width() * extent.height(), 1.0)
+    cells = 0
+    dem_mb = 0.0
+    stages = {
+        'fix geometries': net_prof['vertices'] * COST_FIX_VERTEX,
+    }
+    if contours_prof is not None:
+        cells = net_area / pixel_size ** 2
+        dem_mb = cells * BYTES_DEM_CELL / 2 ** 20
+        stages['DEM'] = cells * COST_DEM_CELL + contours_prof['vertices'] * COST_TIN_VERTEX
+        stages['высота и уклон'] = net_prof['vertices'] * COST_SETZ_VERTEX
+    reach = [
+        min(1.0, math.pi * (speed_kmh * 1000.0 * minutes / 60.0) ** 2 / net_area)
+        for minutes in intervals
+    ]
+    # граф строится по всей сети на каждый интервал, обход - по достижимой части
+    stages['service area'] = sum(
+        net_prof['features'] * (COST_SA_BUILD_EDGE + f * COST_SA_EDGE) for f in reach
+    )
+    buffer_scale = max(buffer_dist, 1.0) / BUFFER_REF_DIST
+    stages['buffer'] = sum(
+        net_prof['vertices'] * f * COST_BUFFER_VERTEX * buffer_scale for f in reach
+    )
+    if pop_count:
+        stages['население'] = len(intervals) * pop_count * COST_POP_TEST
+    other_mb = (
+        net_prof['vertices'] * 3 + net_prof['vertices'] * max(reach, default=0.0) * buffer_scale
+    ) * BYTES_VERTEX / 2 ** 20
+    return {
+        'cells': cells,
+        'stages': stages,
+        'total_min': sum(stages.values()) / 60.0,
+        'memory_mb': dem_mb + other_mb,
+        'dem_min': stages.get('DEM', 0.0) / 60.0,
+        'dem_mb': dem_mb,
+    }
+
+
+# относительное превышение пределов (0 - в пределах), предел 0 не проверяется
+def over_limits(total_min, memory_mb, max_min, max_mb):
+    over = 0.0
+    if max_min > 0:
+        over += max(0.0, total_min - max_min) / max_min
+    if max_mb > 0:
+        over += max(0.0, memory_mb - max_mb) / max_mb
+    return over
+
+
 class IsochronesFromNetworkV6(QgsProcessingAlgorithm):
 
     INPUT_NETWORK = 'INPUT_NETWORK'
@@ -37,6 +273,12 @@ class IsochronesFromNetworkV6(QgsProcessingAlgorithm):
     OUTPUT = 'OUTPUT'
     OUTPUT_START = 'OUTPUT_START'
     OUTPUT_WALKNET = 'OUTPUT_WALKNET'
+    OUTPUT_GPKG = 'OUTPUT_GPKG'
+    LOD_TOLERANCES = 'LOD_TOLERANCES'
+    OUTPUT_LOD = 'OUTPUT_LOD'
+    MAX_RUNTIME_MIN = 'MAX_RUNTIME_MIN'
+    MAX_MEMORY_MB = 'MAX_MEMORY_MB'
+    AUTO_COARSEN = 'AUTO_COARSEN'
 
 
     def tr(self, string):
@@ -179,11 +421,49 @@ class IsochronesFromNetworkV6(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_RUNTIME_MIN,
+                self.tr('Предел времени расчёта, мин (0 - без предела)'),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=30.0,
+                minValue=0.0
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_MEMORY_MB,
+                self.tr('Предел памяти, МБ (0 - без предела)'),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=4096.0,
+                minValue=0.0
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.AUTO_COARSEN,
+                self.tr('Огрублять DEM при превышении пределов'),
+                defaultValue=False
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.LOD_TOLERANCES,
+                self.tr('Допуски упрощения для LOD, м (через запятую)'),
+                defaultValue='5,20,50',
+                optional=True
+            )
+        )
+
         self.addParameter(
             QgsProcessingParameterFeatureSink(
                 self.OUTPUT,
                 self.tr('Изохроны'),
-                QgsProcessing.TypeVectorPolygon
+                QgsProcessing.TypeVectorPolygon,
+                optional=True
             )
         )
 
@@ -191,7 +471,8 @@ class IsochronesFromNetworkV6(QgsProcessingAlgorithm):
             QgsProcessingParameterFeatureSink(
                 self.OUTPUT_START,
                 self.tr('Точка старта'),
-                QgsProcessing.TypeVectorPoint
+                QgsProcessing.TypeVectorPoint,
+                optional=True
             )
         )
         
@@ -199,7 +480,27 @@ class IsochronesFromNetworkV6(QgsProcessingAlgorithm):
             QgsProcessingParameterFeatureSink(
                 self.OUTPUT_WALKNET,
                 self.tr('Пешеходная сеть'),
-                QgsProcessing.TypeVectorLine
+                QgsProcessing.TypeVectorLine,
+                optional=True
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.OUTPUT_GPKG,
+                self.tr('Общий GeoPackage (все слои в одном файле)'),
+                fileFilter='GeoPackage (*.gpkg)',
+                optional=True
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT_LOD,
+                self.tr('Упрощённые изохроны (LOD)'),
+                QgsProcessing.TypeVectorPolygon,
+                optional=True,
+                createByDefault=False
             )
         )
 
@@ -212,15 +513,7 @@ class IsochronesFromNetworkV6(QgsProcessingAlgorithm):
             feedback.pushWarning(
                 self.tr('...')
             )
-        feedback.pushInfo(self.tr('Исправление геометрии сети (Fix geometries)...'))
-        fix_res = processing.run(
-            'native:fixgeometries',
-            {'INPUT': network, 'OUTPUT': 'TEMPORARY_OUTPUT'},
-            context=context,
-            feedback=feedback
-        )
-        net_fixed = fix_res['OUTPUT']
-        crs_authid = net_fixed.crs().authid()
+        crs_authid = network.crs().authid()
         intervals_str = self.parameterAsString(parameters, self.INTERVALS, context)
         try:
             intervals = [
@@ -259,9 +552,106 @@ class IsochronesFromNetworkV6(QgsProcessingAlgorithm):
         start_point_str = f'{start_point.x()},{start_point.y()} [{crs_authid}]'
         pop_layer = self.parameterAsVectorLayer(parameters, self.POP_LAYER, context)
         pop_field = self.parameterAsString(parameters, self.POP_FIELD, context)
+        buffer_dist = self.parameterAsDouble(parameters, self.BUFFER_DIST, context)
+        lod_str = self.parameterAsString(parameters, self.LOD_TOLERANCES, context) or ''
+        try:
+            lod_tolerances = sorted(
+                float(v.strip())
+                for v in lod_str.replace(';', ',').split(',')
+                if v.strip() != ''
+            )
+        except Exception:
+            raise QgsProcessingException(
+                self.tr('Не удалось разобрать допуски упрощения. Пример: 5,20,50')
+            )
+        if any(tol <= 0 for tol in lod_tolerances):
+            raise QgsProcessingException(self.tr('Допуски упрощения должны быть больше 0.'))
+        contours = self.parameterAsVectorLayer(parameters, self.CONTOURS, context)
+        contours_z = self.parameterAsString(parameters, self.CONTOURS_Z, context)
+        use_dem = mode_index == 0 and contours is not None and contours_z
+        max_runtime = self.parameterAsDouble(parameters, self.MAX_RUNTIME_MIN, context)
+        max_memory = self.parameterAsDouble(parameters, self.MAX_MEMORY_MB, context)
+        auto_coarsen = self.parameterAsBoolean(parameters, self.AUTO_COARSEN, context)
+        feedback.pushInfo(self.tr('Предварительная оценка объёма данных...'))
+        net_prof = layer_profile(network)
+        contours_prof = layer_profile(contours) if use_dem else None
+        # население профилируется до загрузки: сама загрузка - часть оцениваемой работы
+        pop_prof = layer_profile(pop_layer) if pop_layer is not None and pop_field else None
+        feedback.pushInfo(
+            self.tr('Сеть: {0} объектов, ~{1} вершин.')
+            .format(net_prof['features'], net_prof['vertices'])
+        )
+        if contours_prof is not None:
+            feedback.pushInfo(
+                self.tr('Изолинии: {0} объектов, ~{1} вершин.')
+                .format(contours_prof['features'], contours_prof['vertices'])
+            )
+        if pop_prof is not None:
+            feedback.pushInfo(
+                self.tr('Население: {0} объектов.').format(pop_prof['features'])
+            )
+        pop_count = pop_prof['features'] if pop_prof is not None else 0
+        dem_pixel_size = DEM_PIXEL_SIZE
+
+        def estimate(pixel_size):
+            return estimate_run(
+                net_prof, contours_prof, pop_count, intervals,
+                default_speed, buffer_dist, pixel_size
+            )
+
+        est = estimate(dem_pixel_size)
+        over = over_limits(est['total_min'], est['memory_mb'], max_runtime, max_memory)
+        if over > 0 and auto_coarsen and contours_prof is not None:
+            # огрубление поможет, только если без DEM прогноз укладывается в пределы
+            base_over = over_limits(
+                est['total_min'] - est['dem_min'], est['memory_mb'] - est['dem_mb'],
+                max_runtime, max_memory
+            )
+            if base_over > 0:
+                feedback.pushWarning(
+                    self.tr('Пределы превышены не из-за DEM - шаг DEM не меняем.')
+                )
+            while over > 0 and dem_pixel_size * 2 <= DEM_MAX_PIXEL_SIZE and base_over == 0:
+                candidate = estimate(dem_pixel_size * 2)
+                candidate_over = over_limits(
+                    candidate['total_min'], candidate['memory_mb'], max_runtime, max_memory
+                )
+                if candidate_over >= over:
+                    break
+                dem_pixel_size *= 2
+                est, over = candidate, candidate_over
+                feedback.pushWarning(
+                    self.tr('Прогноз выше пределов, шаг DEM огрублён до {0} м.')
+                    .format(dem_pixel_size)
+                )
+        if contours_prof is not None:
+            feedback.pushInfo(
+                self.tr('DEM {0} м: ~{1:.0f} ячеек.').format(dem_pixel_size, est['cells'])
+            )
+        for stage, sec in est['stages'].items():
+            feedback.pushInfo(self.tr('  {0}: ~{1:.1f} мин').format(stage, sec / 60.0))
+        feedback.pushInfo(
+            self.tr('Итого ~{0:.1f} мин, пик памяти ~{1:.0f} МБ.')
+            .format(est['total_min'], est['memory_mb'])
+        )
+        if max_runtime > 0 and est['total_min'] > max_runtime:
+            feedback.pushWarning(
+                self.tr('Прогноз времени выше предела ({0:.0f} мин). Сократите список '
+                        'интервалов или самый длинный интервал, уменьшите BUFFER_DIST '
+                        'или охват сети.')
+                .format(max_runtime)
+            )
+        if max_memory > 0 and est['memory_mb'] > max_memory:
+            if contours_prof is not None:
+                hint = self.tr('Уменьшите охват сети или огрубите DEM.')
+            else:
+                hint = self.tr('Уменьшите охват сети.')
+            feedback.pushWarning(
+                self.tr('Прогноз памяти выше предела ({0:.0f} МБ). ').format(max_memory) + hint
+            )
         pop_data = []
         if pop_layer is not None and pop_field:
-            if pop_layer.crs() != net_fixed.crs():
+            if pop_layer.crs() != network.crs():
                 feedback.pushWarning(
                     self.tr('CRS слоя населения отличается от CRS сети. '
                             'Лучше перепроецировать слой населения в тот же CRS.')
@@ -282,12 +672,17 @@ class IsochronesFromNetworkV6(QgsProcessingAlgorithm):
             feedback.pushInfo(
                 self.tr('Слой населения не задан — считаем только площадь.')
             )
-        buffer_dist = self.parameterAsDouble(parameters, self.BUFFER_DIST, context)
-        contours = self.parameterAsVectorLayer(parameters, self.CONTOURS, context)
-        contours_z = self.parameterAsString(parameters, self.CONTOURS_Z, context)
+        feedback.pushInfo(self.tr('Исправление геометрии сети (Fix geometries)...'))
+        fix_res = processing.run(
+            'native:fixgeometries',
+            {'INPUT': network, 'OUTPUT': 'TEMPORARY_OUTPUT'},
+            context=context,
+            feedback=feedback
+        )
+        net_fixed = fix_res['OUTPUT']
         walk_network = net_fixed
         walk_speed_field_name = ''
-        if mode_index == 0 and contours is not None and contours_z:
+        if use_dem:
             if contours.crs() != net_fixed.crs():
                 feedback.pushWarning(
                     self.tr('CRS изолиний отличается от CRS сети. '
@@ -312,7 +707,7 @@ class IsochronesFromNetworkV6(QgsProcessingAlgorithm):
                     'INTERPOLATION_DATA': interp_str,
                     'METHOD': 0,
                     'EXTENT': extent_str,
-                    'PIXEL_SIZE': 30,
+                    'PIXEL_SIZE': dem_pixel_size,
                     'OUTPUT': 'TEMPORARY_OUTPUT'
                 },
                 context=context,
@@ -360,16 +755,45 @@ class IsochronesFromNetworkV6(QgsProcessingAlgorithm):
             )
             walk_network = fc_res['OUTPUT']
             walk_speed_field_name = 'walk_spd'
-        (walk_sink, walk_dest_id) = self.parameterAsSink(
-            parameters,
-            self.OUTPUT_WALKNET,
-            context,
-            walk_network.fields(),
-            walk_network.wkbType(),
-            walk_network.crs()
+        walknet_changed = walk_network is not net_fixed
+        walk_def = parameters.get(self.OUTPUT_WALKNET)
+        if isinstance(walk_def, QgsProcessingOutputLayerDefinition):
+            walk_def = walk_def.sink.staticValue()
+        walk_to_file = (
+            bool(walk_def)
+            and str(walk_def) != QgsProcessing.TEMPORARY_OUTPUT
+            and not str(walk_def).startswith('memory:')
         )
-        for f in walk_network.getFeatures():
-            walk_sink.addFeature(f, QgsFeatureSink.FastInsert)
+        walk_dest_id = None
+        if walknet_changed or walk_to_file:
+            if not walknet_changed:
+                feedback.pushInfo(
+                    self.tr('Сеть без изменений, но для OUTPUT_WALKNET задан файл - копируем сеть.')
+                )
+            (walk_sink, walk_dest_id) = self.parameterAsSink(
+                parameters,
+                self.OUTPUT_WALKNET,
+                context,
+                walk_network.fields(),
+                walk_network.wkbType(),
+                walk_network.crs()
+            )
+            if walk_sink is not None:
+                walk_sink.addFeatures(walk_network.getFeatures(), QgsFeatureSink.FastInsert)
+        elif walk_def:
+            # сеть не менялась и выход временный - не копируем, отдаём исправленную сеть
+            feedback.pushInfo(
+                self.tr('Сеть без изменений: OUTPUT_WALKNET - исправленная сеть без копирования.')
+            )
+            if context.temporaryLayerStore().mapLayer(net_fixed.id()) is None:
+                context.temporaryLayerStore().addMapLayer(net_fixed)
+            context.addLayerToLoadOnCompletion(
+                net_fixed.id(),
+                QgsProcessingContext.LayerDetails(
+                    self.tr('Пешеходная сеть'), context.project(), self.OUTPUT_WALKNET
+                )
+            )
+            walk_dest_id = net_fixed.id()
         fields = QgsFields()
         fields.append(QgsField('id', QVariant.Int))
         fields.append(QgsField('t_min', QVariant.Double, 'double', 10, 2))
@@ -377,6 +801,7 @@ class IsochronesFromNetworkV6(QgsProcessingAlgorithm):
         fields.append(QgsField('area_km2', QVariant.Double, 'double', 20, 3))
         if pop_data:
             fields.append(QgsField('pop_sum', QVariant.Double, 'double', 20, 2))
+        gpkg_path = self.parameterAsFileOutput(parameters, self.OUTPUT_GPKG, context)
         (sink, dest_id) = self.parameterAsSink(
             parameters,
             self.OUTPUT,
@@ -385,6 +810,10 @@ class IsochronesFromNetworkV6(QgsProcessingAlgorithm):
             QgsWkbTypes.MultiPolygon,
             net_fixed.crs()
         )
+        if sink is None and not gpkg_path:
+            raise QgsProcessingException(
+                self.tr('Укажите выход «Изохроны» или общий GeoPackage.')
+            )
         pt_fields = QgsFields()
         pt_fields.append(QgsField('id', QVariant.Int))
         pt_fields.append(QgsField('mode', QVariant.String, 'string', 32))
@@ -400,7 +829,9 @@ class IsochronesFromNetworkV6(QgsProcessingAlgorithm):
         pt_feat.setGeometry(QgsGeometry.fromPointXY(start_point))
         pt_feat['id'] = 1
         pt_feat['mode'] = mode_labels[mode_index]
-        sink_pt.addFeature(pt_feat, QgsFeatureSink.FastInsert)
+        if sink_pt is not None:
+            sink_pt.addFeature(pt_feat, QgsFeatureSink.FastInsert)
+        iso_feats = []
         total_steps = max(1, len(intervals) * 3)
         step = 0
         feedback.pushInfo(self.tr('Поиск расстояния до ближайшей линии сети...'))
@@ -536,9 +967,78 @@ class IsochronesFromNetworkV6(QgsProcessingAlgorithm):
                 out_feat['area_km2'] = area_km2
                 if pop_data:
                     out_feat['pop_sum'] = pop_sum_val
-                sink.addFeature(out_feat, QgsFeatureSink.FastInsert)
-        return {
+                iso_feats.append(out_feat)
+        if sink is not None:
+            sink.addFeatures(iso_feats, QgsFeatureSink.FastInsert)
+        results = {
             self.OUTPUT: dest_id,
             self.OUTPUT_START: dest_pt_id,
             self.OUTPUT_WALKNET: walk_dest_id
         }
+        lod_fields = QgsFields()
+        lod_fields.append(QgsField('id', QVariant.Int))
+        lod_fields.append(QgsField('t_min', QVariant.Double, 'double', 10, 2))
+        lod_fields.append(QgsField('mode', QVariant.String, 'string', 32))
+        lod_fields.append(QgsField('tol_m', QVariant.Double, 'double', 10, 2))
+        lod_fields.append(QgsField('n_vert', QVariant.Int))
+        lod_fields.append(QgsField('n_vert_src', QVariant.Int))
+        lod_fields.append(QgsField('area_dpct', QVariant.Double, 'double', 10, 3))
+        (lod_sink, lod_dest_id) = self.parameterAsSink(
+            parameters,
+            self.OUTPUT_LOD,
+            context,
+            lod_fields,
+            QgsWkbTypes.MultiPolygon,
+            net_fixed.crs()
+        )
+        lod_feats = []
+        if lod_sink is not None and lod_tolerances and iso_feats:
+            exact_geoms = [f.geometry() for f in iso_feats]
+            for tol in lod_tolerances:
+                for src_feat, exact, geom in zip(
+                    iso_feats, exact_geoms, simplify_nested(exact_geoms, tol)
+                ):
+                    if geom is None:
+                        continue
+                    exact_area = exact.area()
+                    lod_feat = QgsFeature(lod_fields)
+                    lod_feat.setGeometry(geom)
+                    lod_feat['id'] = src_feat['id']
+                    lod_feat['t_min'] = src_feat['t_min']
+                    lod_feat['mode'] = src_feat['mode']
+                    lod_feat['tol_m'] = tol
+                    lod_feat['n_vert'] = geom.constGet().nCoordinates()
+                    lod_feat['n_vert_src'] = exact.constGet().nCoordinates()
+                    lod_feat['area_dpct'] = (
+                        100.0 * (geom.area() - exact_area) / exact_area if exact_area else 0.0
+                    )
+                    lod_feats.append(lod_feat)
+                feedback.pushInfo(
+                    self.tr('LOD {0} м: {1} вершин (исходно {2})').format(
+                        tol,
+                        sum(f['n_vert'] for f in lod_feats if f['tol_m'] == tol),
+                        sum(g.constGet().nCoordinates() for g in exact_geoms)
+                    )
+                )
+        if lod_sink is not None:
+            lod_sink.addFeatures(lod_feats, QgsFeatureSink.FastInsert)
+            results[self.OUTPUT_LOD] = lod_dest_id
+        if gpkg_path:
+            feedback.pushInfo(self.tr('Запись слоёв в {0}...').format(gpkg_path))
+            gpkg_layers = [
+                ('isochrones', memory_layer(
+                    'isochrones', fields, QgsWkbTypes.MultiPolygon, net_fixed.crs(), iso_feats
+                )),
+                ('start_point', memory_layer(
+                    'start_point', pt_fields, QgsWkbTypes.Point, net_fixed.crs(), [pt_feat]
+                )),
+            ]
+            if lod_feats:
+                gpkg_layers.append(('isochrones_lod', memory_layer(
+                    'isochrones_lod', lod_fields, QgsWkbTypes.MultiPolygon, net_fixed.crs(), lod_feats
+                )))
+            if walknet_changed:
+                gpkg_layers.append(('walknet', walk_network))
+            write_gpkg_layers(gpkg_path, gpkg_layers, feedback)
+            results[self.OUTPUT_GPKG] = gpkg_path
+        return results